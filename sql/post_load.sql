@@ -0,0 +1,54 @@
+-- Constraints e índices secundários do esquema (TP1-BD), aplicados após a carga em massa:
+-- cada FK é validada uma única vez e cada índice é construído em lote, em vez de
+-- serem mantidos linha a linha durante o COPY.
+
+-- Tabelas referenciadas primeiro: uma tabela LOGGED não pode ter FK para uma UNLOGGED
+ALTER TABLE product SET LOGGED;
+ALTER TABLE customer SET LOGGED;
+ALTER TABLE category SET LOGGED;
+ALTER TABLE review SET LOGGED;
+ALTER TABLE product_category SET LOGGED;
+ALTER TABLE product_similar SET LOGGED;
+
+ALTER TABLE category
+    ADD CONSTRAINT fk_category_parent
+        FOREIGN KEY (parent_id)
+        REFERENCES category (category_id)
+        DEFERRABLE INITIALLY DEFERRED;
+
+ALTER TABLE review
+    ADD CONSTRAINT review_pkey
+        PRIMARY KEY (review_id),
+    ADD CONSTRAINT fk_review_product
+        FOREIGN KEY (asin)
+        REFERENCES product (asin)
+        DEFERRABLE INITIALLY DEFERRED,
+    ADD CONSTRAINT fk_review_customer
+        FOREIGN KEY (customer_id)
+        REFERENCES customer (customer_id)
+        DEFERRABLE INITIALLY DEFERRED;
+
+ALTER TABLE product_category
+    ADD CONSTRAINT fk_product_category_product
+        FOREIGN KEY (asin)
+        REFERENCES product (asin)
+        DEFERRABLE INITIALLY DEFERRED,
+    ADD CONSTRAINT fk_product_category_category
+        FOREIGN KEY (category_id)
+        REFERENCES category (category_id)
+        DEFERRABLE INITIALLY DEFERRED;
+
+ALTER TABLE product_similar
+    ADD CONSTRAINT fk_product_similar_product
+        FOREIGN KEY (asin)
+        REFERENCES product (asin)
+        DEFERRABLE INITIALLY DEFERRED,
+    ADD CONSTRAINT fk_product_similar_similar
+        FOREIGN KEY (similar_asin)
+        REFERENCES product (asin)
+        DEFERRABLE INITIALLY DEFERRED;
+
+CREATE INDEX idx_review_asin ON review (asin);
+CREATE INDEX idx_product_category_cat ON product_category (category_id);
+-- Top 10 por grupo do dashboard (Consulta 4): cada grupo lê só as 10 primeiras entradas do índice
+CREATE INDEX idx_product_group_salesrank ON product (group_name, salesrank);
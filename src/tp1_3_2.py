@@ -1,29 +1,67 @@
 import argparse
+import collections
+import functools
+import io
+import multiprocessing
+import os
 import re
 import sys
 import time
-from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Set, TextIO, Tuple
 
-from db import get_conn
+from db import get_conn
 
 
-ReviewEntry = Dict[str, Optional[object]]
-CategoryPath = List[Tuple[str, str]]
+# (data, cliente, rating, votes, helpful), na ordem da linha de review do SNAP
+ReviewEntry = Tuple[str, str, int, int, int]
+CategoryPath = Tuple[Tuple[str, Optional[int]], ...]
 ProductData = Dict[str, object]
 FlushFunction = Callable[[str], None]
+QueueFunction = Callable[[Tuple[object, ...]], None]
+LineHandler = Callable[[ProductData, str, TextIO], None]
+ProductCallback = Callable[[ProductData], None]
+
+# Linhas por lote de COPY, por tabela: tabelas estreitas aguentam lotes bem maiores
+# (menos round-trips e merges) sem pesar na memória; product e review, com mais
+# colunas e textos, ficam em 5000
+BATCH_SIZES: Dict[str, int] = {
+    "product": 5000,
+    "category": 10000,
+    "customer": 50000,
+    "review": 5000,
+    "product_category": 20000,
+    "product_similar": 50000,
+}
+
+SCHEMA_PATH = "/app/sql/schema.sql"
+# FKs e índices secundários, criados só depois da carga (ver _apply_post_load_constraints)
+POST_LOAD_SCHEMA_PATH = "/app/sql/post_load.sql"
+
+# Ajustes da sessão para a carga em massa: sem fsync por commit e mais memória para
+# ordenações, hashes e criação de índices/FKs pós-carga. São SET de sessão (e não
+# SET LOCAL) porque precisam valer além do commit do DDL do schema.
+SESSION_SETTINGS: Tuple[str, ...] = (
+    "SET synchronous_commit TO OFF",
+    "SET client_min_messages TO WARNING",
+    "SET maintenance_work_mem TO '1GB'",
+    "SET work_mem TO '256MB'",
+)
+
+# Buffer de leitura do arquivo SNAP (o padrão de 8 KiB gera milhões de read() em arquivos de GBs)
+INPUT_BUFFER_SIZE = 8 * 1024 * 1024
 
-BATCH_SIZE = 5000
+# Tamanho aproximado (em bytes) de cada fatia do arquivo entregue a um worker com --workers > 1
+PARSE_CHUNK_SIZE = 16 * 1024 * 1024
 
+# Fatias já despachadas e ainda não consumidas, por worker: limita a memória quando o COPY
+# fica para trás dos parsers (cada fatia parseada ocupa várias vezes PARSE_CHUNK_SIZE)
+MAX_PENDING_CHUNKS_PER_WORKER = 2
+
+# ASIN repetido no arquivo: vale a primeira ocorrência (as seguintes são ignoradas)
 SQL_INSERT_PRODUCT = (
     "INSERT INTO product (asin, title, group_name, salesrank, total_reviews, downloaded, avg_rating) "
     "VALUES (%s, %s, %s, %s, %s, %s, %s) "
-    "ON CONFLICT (asin) DO UPDATE SET "
-    "title = EXCLUDED.title, "
-    "group_name = EXCLUDED.group_name, "
-    "salesrank = EXCLUDED.salesrank, "
-    "total_reviews = EXCLUDED.total_reviews, "
-    "downloaded = EXCLUDED.downloaded, "
-    "avg_rating = EXCLUDED.avg_rating"
+    "ON CONFLICT (asin) DO NOTHING"
 )
 
 SQL_INSERT_CATEGORY = (
@@ -49,9 +87,9 @@ SQL_INSERT_REVIEW = (
     "ON CONFLICT (asin, customer_id, review_date) DO NOTHING"
 )
 
+# Pares similares ficam no staging até o fim da carga (o ASIN alvo pode aparecer depois no arquivo)
 SQL_INSERT_SIMILAR = (
-    "INSERT INTO product_similar (asin, similar_asin) VALUES (%s, %s) "
-    "ON CONFLICT (asin, similar_asin) DO NOTHING"
+    "INSERT INTO stage_product_similar (asin, similar_asin) VALUES (%s, %s)"
 )
 
 INSERT_STATEMENTS: Dict[str, str] = {
@@ -63,24 +101,136 @@ INSERT_STATEMENTS: Dict[str, str] = {
     "product_similar": SQL_INSERT_SIMILAR,
 }
 
-POST_LOAD_STATEMENTS: Tuple[str, ...] = (
-    "ANALYZE",
-)
-
-TABLE_DEPENDENCIES: Dict[str, Tuple[str, ...]] = {
-    "product_category": ("product", "category"),
-    "review": ("product", "customer"),
-    "product_similar": ("product",),
-}
-
-FINAL_FLUSH_ORDER: Tuple[str, ...] = (
-    "product",
-    "category",
-    "customer",
-    "review",
-    "product_category",
-    "product_similar",
-)
+TABLE_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "product": ("asin", "title", "group_name", "salesrank", "total_reviews", "downloaded", "avg_rating"),
+    "category": ("category_id", "category_name", "parent_id"),
+    "product_category": ("asin", "category_id"),
+    "customer": ("customer_id",),
+    "review": ("review_date", "rating", "votes", "helpful", "asin", "customer_id"),
+    "product_similar": ("asin", "similar_asin"),
+}
+
+# Tabelas temporárias (sem constraints) que recebem cada lote via COPY antes do merge
+STAGING_TABLES: Dict[str, str] = {table: f"stage_{table}" for table in TABLE_COLUMNS}
+
+# Tipos das colunas no COPY binário (mesma ordem de TABLE_COLUMNS). Inteiros vão como int8:
+# o dumper binário de int4 do psycopg trunca valores fora da faixa sem erro, enquanto o
+# cast int8 -> INTEGER do merge rejeita o lote e aciona o fallback linha a linha.
+COPY_TYPES: Dict[str, Tuple[str, ...]] = {
+    "product": ("varchar", "text", "text", "int8", "int8", "int8", "float8"),
+    "category": ("int8", "text", "int8"),
+    "product_category": ("varchar", "int8"),
+    "customer": ("varchar",),
+    # review_date chega como texto ("2000-7-28") e é convertida para DATE no merge
+    "review": ("text", "int8", "int8", "int8", "varchar", "varchar"),
+    "product_similar": ("varchar", "varchar"),
+}
+
+# Staging com coluna load_order: fora da lista do COPY, o DEFAULT da sequência numera as linhas
+# na ordem do arquivo, e o merge usa essa ordem para decidir qual duplicata prevalece
+ORDERED_STAGING_TABLES: Tuple[str, ...] = ("product", "category")
+
+STAGING_STATEMENTS: Dict[str, str] = {
+    table: (
+        f"CREATE TEMP TABLE {STAGING_TABLES[table]} ("
+        + ", ".join(f"{column} {col_type}" for column, col_type in zip(columns, COPY_TYPES[table]))
+        + (", load_order bigserial" if table in ORDERED_STAGING_TABLES else "")
+        + ")"
+    )
+    for table, columns in TABLE_COLUMNS.items()
+}
+
+COPY_STATEMENTS: Dict[str, str] = {
+    table: f"COPY {STAGING_TABLES[table]} ({', '.join(columns)}) FROM STDIN WITH (FORMAT BINARY)"
+    for table, columns in TABLE_COLUMNS.items()
+}
+
+# Primeira ocorrência de cada ASIN: a mais antiga do lote (load_order) e, entre lotes, a já gravada
+SQL_MERGE_PRODUCT = (
+    "INSERT INTO product (asin, title, group_name, salesrank, total_reviews, downloaded, avg_rating) "
+    "SELECT DISTINCT ON (asin) asin, title, group_name, salesrank, total_reviews, downloaded, avg_rating "
+    "FROM stage_product "
+    "ORDER BY asin, load_order "
+    "ON CONFLICT (asin) DO NOTHING"
+)
+
+# Última definição de cada categoria no arquivo (como o DO UPDATE linha a linha faria)
+SQL_SELECT_STAGED_CATEGORY = (
+    "SELECT DISTINCT ON (category_id) category_id, category_name, parent_id "
+    "FROM stage_category "
+    "ORDER BY category_id, load_order DESC"
+)
+
+SQL_MERGE_CATEGORY = (
+    "INSERT INTO category (category_id, category_name, parent_id) "
+    + SQL_SELECT_STAGED_CATEGORY
+    + " ON CONFLICT (category_id) DO UPDATE SET "
+    "category_name = EXCLUDED.category_name, "
+    "parent_id = EXCLUDED.parent_id"
+)
+
+SQL_MERGE_PRODUCT_CATEGORY = (
+    "INSERT INTO product_category (asin, category_id) "
+    "SELECT asin, category_id FROM stage_product_category "
+    "ON CONFLICT (asin, category_id) DO NOTHING"
+)
+
+SQL_MERGE_CUSTOMER = (
+    "INSERT INTO customer (customer_id) "
+    "SELECT customer_id FROM stage_customer "
+    "ON CONFLICT (customer_id) DO NOTHING"
+)
+
+SQL_MERGE_REVIEW = (
+    "INSERT INTO review (review_date, rating, votes, helpful, asin, customer_id) "
+    "SELECT review_date::date, rating, votes, helpful, asin, customer_id FROM stage_review "
+    "ON CONFLICT (asin, customer_id, review_date) DO NOTHING"
+)
+
+SQL_MERGE_SIMILAR = (
+    "INSERT INTO product_similar (asin, similar_asin) "
+    "SELECT s.asin, s.similar_asin FROM stage_product_similar s "
+    "JOIN product p ON p.asin = s.asin "
+    "JOIN product sp ON sp.asin = s.similar_asin "
+    "ON CONFLICT (asin, similar_asin) DO NOTHING"
+)
+
+MERGE_STATEMENTS: Dict[str, str] = {
+    "product": SQL_MERGE_PRODUCT,
+    "product_category": SQL_MERGE_PRODUCT_CATEGORY,
+    "customer": SQL_MERGE_CUSTOMER,
+    "review": SQL_MERGE_REVIEW,
+}
+
+# Tabelas cujo staging acumula a carga inteira e só é mesclado depois do flush final.
+# category entra aqui porque as mesmas categorias se repetem em quase todo produto: um
+# único DISTINCT ON no fim evita reaplicar o DO UPDATE às mesmas linhas a cada lote
+DEFERRED_MERGE_STATEMENTS: Dict[str, str] = {
+    "category": SQL_MERGE_CATEGORY,
+    "product_similar": SQL_MERGE_SIMILAR,
+}
+
+# Inserção linha a linha usada se o merge adiado falhar (ex.: id fora da faixa de INTEGER):
+# linhas lidas do staging e o INSERT de cada uma. product_similar não precisa: o merge só
+# cruza ASINs já validados no COPY
+DEFERRED_ROW_STATEMENTS: Dict[str, Tuple[str, str]] = {
+    "category": (SQL_SELECT_STAGED_CATEGORY, SQL_INSERT_CATEGORY),
+}
+
+POST_LOAD_STATEMENTS: Tuple[str, ...] = (
+    "ANALYZE",
+)
+
+# Cada tabela é gravada de forma independente (as FKs só são criadas depois da carga, em
+# post_load.sql); a ordem do flush final só precisa deixar tudo no banco antes dos merges adiados
+FINAL_FLUSH_ORDER: Tuple[str, ...] = (
+    "product",
+    "category",
+    "customer",
+    "review",
+    "product_category",
+    "product_similar",
+)
 
 
 REVIEW_PATTERN = re.compile(
@@ -93,6 +243,14 @@ REVIEW_PATTERN = re.compile(
     re.IGNORECASE,
 )
 
+REVIEW_CUSTOMER_LABELS = frozenset(("customer:", "cutomer:"))
+# Mesmo formato de data do REVIEW_PATTERN, para validar o token no caminho rápido
+REVIEW_DATE_PATTERN = re.compile(r"\d{4}-\d{1,2}-\d{1,2}", re.ASCII)
+
+REVIEWS_TOTAL_PATTERN = re.compile(r"total:\s*(\d+)")
+REVIEWS_DOWNLOADED_PATTERN = re.compile(r"downloaded:\s*(\d+)")
+REVIEWS_AVG_PATTERN = re.compile(r"avg rating:\s*([\d.]+)")
+
 
 def _normalize_int(value: Optional[object], default: int = 0) -> int:
     try:
@@ -113,229 +271,536 @@ def _normalize_float(value: Optional[object], default: float = 0.0) -> float:
 
 
 def _parse_review_line(raw_line: str) -> Optional[ReviewEntry]:
+    # Caminho rápido: layout fixo do SNAP "DATA customer: ID rating: N votes: N helpful: N",
+    # só com rótulos exatos, data válida e números em dígitos ASCII; o resto cai no regex
+    toks = raw_line.split()
+    if (
+        len(toks) == 9
+        and toks[1].lower() in REVIEW_CUSTOMER_LABELS
+        and toks[3] == "rating:"
+        and toks[5] == "votes:"
+        and toks[7] == "helpful:"
+        and REVIEW_DATE_PATTERN.fullmatch(toks[0])
+    ):
+        digits = toks[4] + toks[6] + toks[8]
+        if digits.isascii() and digits.isdigit():
+            return toks[0], toks[2], int(toks[4]), int(toks[6]), int(toks[8])
     match = REVIEW_PATTERN.match(raw_line.strip())
     if not match:
         return None
-    groups = match.groupdict()
-    return {
-        "date": groups.get("date"),
-        "customer": groups.get("customer"),
-        "rating": _normalize_int(groups.get("rating")),
-        "votes": _normalize_int(groups.get("votes")),
-        "helpful": _normalize_int(groups.get("helpful")),
-    }
+    # os grupos numéricos do REVIEW_PATTERN só casam com \d+: int() direto, sem try/except
+    return (
+        match["date"],
+        match["customer"],
+        int(match["rating"]),
+        int(match["votes"]),
+        int(match["helpful"]),
+    )
+
+
+def _parse_reviews_header(line: str) -> Tuple[Optional[int], Optional[int], Optional[float]]:
+    # Caminho rápido: "total: N  downloaded: N  avg rating: X" (após o "reviews:"), aceitando
+    # só o que os regexes aceitariam (dígitos ASCII e, na média, pontos); o resto cai nos regexes
+    toks = line.split()
+    if (
+        len(toks) == 7
+        and toks[0] == "total:"
+        and toks[2] == "downloaded:"
+        and toks[4] == "avg"
+        and toks[5] == "rating:"
+    ):
+        digits = toks[1] + toks[3] + toks[6].replace(".", "")
+        if digits.isascii() and digits.isdigit():
+            try:
+                return int(toks[1]), int(toks[3]), float(toks[6])
+            except ValueError:
+                pass
+    m_total = REVIEWS_TOTAL_PATTERN.search(line)
+    m_down = REVIEWS_DOWNLOADED_PATTERN.search(line)
+    m_avg = REVIEWS_AVG_PATTERN.search(line)
+    return (
+        int(m_total.group(1)) if m_total else None,
+        int(m_down.group(1)) if m_down else None,
+        float(m_avg.group(1)) if m_avg else None,
+    )
+
+
+# O mesmo caminho de categorias se repete em milhares de produtos; o cache é limitado
+# pelo número de caminhos distintos do arquivo (ordem de dezenas de milhares)
+@functools.lru_cache(maxsize=None)
+def _parse_category_path(cat_line: str) -> CategoryPath:
+    if cat_line.startswith("|"):
+        cat_line = cat_line[1:]
+    # o id já sai convertido para int (None se não for numérico): com o lru_cache, cada
+    # caminho distinto paga o isdigit()/int() uma vez só
+    path: List[Tuple[str, Optional[int]]] = []
+    for seg in cat_line.split("|"):
+        if not seg:
+            continue
+        if "[" in seg:
+            name, cid = seg.rsplit("[", 1)
+            cid = cid.rstrip("]")
+        else:
+            name, cid = seg, ""
+        path.append((name.strip(), int(cid) if cid.isdigit() else None))
+    return tuple(path)
+
+
+def _ensure_product_defaults(
+    product_data: ProductData,
+) -> Optional[Tuple[str, str, Optional[str], Optional[int], Optional[int], Optional[int], Optional[float]]]:
+    asin = product_data.get("asin")
+    if not asin:
+        return None
+
+    discontinued = bool(product_data.get("discontinued"))
+
+    title = product_data.get("title")
+    if not title:
+        title = "Discontinued product" if discontinued else "Unknown title"
+
+    group_name = product_data.get("group")
+    if not group_name:
+        group_name = None if discontinued else "Unknown"
+
+    salesrank_raw = product_data.get("salesrank")
+    if discontinued:
+        salesrank = salesrank_raw if isinstance(salesrank_raw, int) else None
+    else:
+        salesrank = _normalize_int(salesrank_raw)
+
+    total_reviews_raw = product_data.get("total_reviews")
+    if discontinued and total_reviews_raw is None:
+        total_reviews = None
+    else:
+        total_reviews = _normalize_int(total_reviews_raw)
+
+    downloaded_raw = product_data.get("downloaded")
+    if discontinued and downloaded_raw is None:
+        downloaded = None
+    else:
+        downloaded = _normalize_int(downloaded_raw)
+
+    avg_rating_raw = product_data.get("avg_rating")
+    if discontinued and avg_rating_raw is None:
+        avg_rating = None
+    else:
+        avg_rating = _normalize_float(avg_rating_raw)
+
+    return asin, title, group_name, salesrank, total_reviews, downloaded, avg_rating
+
+
+def _create_queue_function(
+    table: str,
+    buffers: Dict[str, List[Tuple[object, ...]]],
+    flush: "FlushFunction",
+    batch_sizes: Dict[str, int] = BATCH_SIZES,
+) -> "QueueFunction":
+    # Buffer e limite resolvidos uma vez: por linha sobra só append + len.
+    # O flush esvazia o buffer com clear(), então a referência capturada continua válida
+    buffer = buffers[table]
+    append = buffer.append
+    batch_size = batch_sizes[table]
+
+    def _queue(params: Tuple[object, ...]) -> None:
+        append(params)
+        if len(buffer) >= batch_size:
+            flush(table)
+
+    return _queue
+
+
+def _queue_rows(
+    table: str,
+    rows: List[Tuple[object, ...]],
+    buffers: Dict[str, List[Tuple[object, ...]]],
+    flush: "FlushFunction",
+    batch_sizes: Dict[str, int] = BATCH_SIZES,
+) -> None:
+    # As linhas de uma fatia inteira entram em pedaços de até batch_size: o COPY, o merge, o
+    # fallback linha a linha e o progresso seguem o mesmo tamanho de lote da carga sequencial
+    buffer = buffers[table]
+    batch_size = batch_sizes[table]
+    start = 0
+    while start < len(rows):
+        end = start + batch_size - len(buffer)
+        buffer.extend(rows[start:end])
+        start = end
+        if len(buffer) >= batch_size:
+            flush(table)
+
+
+def _insert_rows_individually(
+    cur,
+    table: str,
+    statement: str,
+    rows: List[Tuple[object, ...]],
+    savepoint: str,
+) -> int:
+    # Caminho de erro: cada linha no seu savepoint, descartando só as que falharem
+    inserted = 0
+    row_savepoint = f"{savepoint}_row"
+    for params in rows:
+        cur.execute(f"SAVEPOINT {row_savepoint}")
+        try:
+            cur.execute(statement, params)
+            cur.execute(f"RELEASE SAVEPOINT {row_savepoint}")
+            inserted += 1
+        except Exception as row_exc:
+            cur.execute(f"ROLLBACK TO SAVEPOINT {row_savepoint}")
+            print(
+                f"[Carga][Erro] Registro ignorado em {table}: {row_exc}. Valores: {params}",
+                file=sys.stderr,
+            )
+    return inserted
 
 
-def _ensure_product_defaults(
-    product_data: ProductData,
-) -> Optional[Tuple[str, str, Optional[str], Optional[int], Optional[int], Optional[int], Optional[float]]]:
-    asin = product_data.get("asin")
-    if not asin:
-        return None
-
-    discontinued = bool(product_data.get("discontinued"))
-
-    title = product_data.get("title")
-    if not title:
-        title = "Discontinued product" if discontinued else "Unknown title"
-
-    group_name = product_data.get("group")
-    if not group_name:
-        group_name = None if discontinued else "Unknown"
-
-    salesrank_raw = product_data.get("salesrank")
-    if discontinued:
-        salesrank = salesrank_raw if isinstance(salesrank_raw, int) else None
-    else:
-        salesrank = _normalize_int(salesrank_raw)
-
-    total_reviews_raw = product_data.get("total_reviews")
-    if discontinued and total_reviews_raw is None:
-        total_reviews = None
-    else:
-        total_reviews = _normalize_int(total_reviews_raw)
-
-    downloaded_raw = product_data.get("downloaded")
-    if discontinued and downloaded_raw is None:
-        downloaded = None
-    else:
-        downloaded = _normalize_int(downloaded_raw)
-
-    avg_rating_raw = product_data.get("avg_rating")
-    if discontinued and avg_rating_raw is None:
-        avg_rating = None
-    else:
-        avg_rating = _normalize_float(avg_rating_raw)
-
-    return asin, title, group_name, salesrank, total_reviews, downloaded, avg_rating
-
-
-def _queue_with_flush(
-    table: str,
-    params: Tuple[object, ...],
-    buffers: Dict[str, List[Tuple[object, ...]]],
-    flush: "FlushFunction",
-    dependencies: Dict[str, Tuple[str, ...]] = TABLE_DEPENDENCIES,
-) -> None:
-    buffer = buffers[table]
-    buffer.append(params)
-    if len(buffer) >= BATCH_SIZE:
-        for dep_table in dependencies.get(table, ()):  # garante que dependências existam antes do commit
-            flush(dep_table)
-        flush(table)
-
-
-def _create_flush_function(
-    conn,
-    cur,
-    buffers: Dict[str, List[Tuple[object, ...]]],
-    counts: Dict[str, int],
-    flush_counters: Dict[str, int],
-) -> FlushFunction:
+def _create_flush_function(
+    conn,
+    cur,
+    buffers: Dict[str, List[Tuple[object, ...]]],
+    counts: Dict[str, int],
+) -> FlushFunction:
     def _flush(table: str) -> None:
         batch = buffers[table]
         if not batch:
             return
-        savepoint = f"sp_{table}_{flush_counters[table]}"
-        flush_counters[table] += 1
+        # um único savepoint por lote (liberado ao final), com nome fixo: a carga inteira é uma
+        # transação só, então ele é o que permite descartar apenas o lote que falhou
+        savepoint = f"sp_{table}"
         inserted_now = 0
         cur.execute(f"SAVEPOINT {savepoint}")
-        try:
-            cur.executemany(INSERT_STATEMENTS[table], batch)
-            inserted_now = len(batch)
-        except Exception as batch_exc:  # pragma: no cover - fallback path
-            cur.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+        try:
+            # COPY para a tabela de staging + um único INSERT ... SELECT preserva o ON CONFLICT
+            with cur.copy(COPY_STATEMENTS[table]) as copy:
+                copy.set_types(COPY_TYPES[table])
+                for params in batch:
+                    copy.write_row(params)
+            # merge, release e limpeza do staging seguem juntos em um único round-trip. O TRUNCATE
+            # vem depois do RELEASE: dentro do savepoint o Postgres não trunca no lugar e cria um
+            # arquivo novo por lote, mantendo os antigos (com as linhas) até o COMMIT final
+            with conn.pipeline():
+                if table in MERGE_STATEMENTS:
+                    cur.execute(MERGE_STATEMENTS[table])
+                cur.execute(f"RELEASE SAVEPOINT {savepoint}")
+                if table in MERGE_STATEMENTS:
+                    cur.execute(f"TRUNCATE {STAGING_TABLES[table]}")
+            inserted_now = len(batch)
+        except Exception as batch_exc:  # pragma: no cover - fallback path
+            cur.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
             print(
                 f"[Carga][Aviso] Erro no lote da tabela {table}: {batch_exc}. "
                 "Tentando inserções individuais...",
                 file=sys.stderr,
             )
-            for idx, params in enumerate(batch):
-                row_savepoint = f"{savepoint}_r{idx}"
-                cur.execute(f"SAVEPOINT {row_savepoint}")
-                try:
-                    cur.execute(INSERT_STATEMENTS[table], params)
-                    cur.execute(f"RELEASE SAVEPOINT {row_savepoint}")
-                    inserted_now += 1
-                except Exception as row_exc:
-                    cur.execute(f"ROLLBACK TO SAVEPOINT {row_savepoint}")
-                    print(
-                        f"[Carga][Erro] Registro ignorado em {table}: {row_exc}. Valores: {params}",
-                        file=sys.stderr,
-                    )
-            cur.execute(f"RELEASE SAVEPOINT {savepoint}")
-        else:
+            inserted_now = _insert_rows_individually(cur, table, INSERT_STATEMENTS[table], batch, savepoint)
             cur.execute(f"RELEASE SAVEPOINT {savepoint}")
 
-        conn.commit()
-        counts[table] += inserted_now
-        buffers[table].clear()
-        if inserted_now and counts[table] % BATCH_SIZE == 0:
-            print(f"[Carga][Batch] {table}: {counts[table]} registros inseridos.")
+        counts[table] += inserted_now
+        buffers[table].clear()
+        # tabelas de merge adiado só foram para o staging: o total real sai de _merge_deferred_staging
+        if inserted_now and table not in DEFERRED_MERGE_STATEMENTS and counts[table] % BATCH_SIZES[table] == 0:
+            print(f"[Carga][Batch] {table}: {counts[table]} registros inseridos.")
 
     return _flush
 
 
-def _insert_product(
-    product_data: ProductData,
-    buffers: Dict[str, List[Tuple[object, ...]]],
-    flush: "FlushFunction",
-    inserted_products: Set[str],
-    pending_similars: Dict[str, Set[str]],
-) -> None:
-    product_defaults = _ensure_product_defaults(product_data)
-    if not product_defaults:
-        return
-
-    asin, title, group_name, salesrank, total_reviews, downloaded, avg_rating = product_defaults
-
-    if asin not in inserted_products:
-        inserted_products.add(asin)
-        _queue_with_flush(
-            "product",
-            (asin, title, group_name, salesrank, total_reviews, downloaded, avg_rating),
-            buffers,
-            flush,
-        )
-
-    for path in product_data.get("categories", []):
-        if not isinstance(path, Sequence) or not path:
-            continue
-        for idx, (cat_name, cat_id) in enumerate(path):
-            parent_id = None
-            if idx > 0:
-                parent_raw = path[idx - 1][1]
-                parent_id = int(parent_raw) if isinstance(parent_raw, str) and parent_raw.isdigit() else None
-            cat_id_val = int(cat_id) if isinstance(cat_id, str) and cat_id.isdigit() else None
-            if cat_id_val is None:
-                continue
-            _queue_with_flush(
-                "category",
-                (cat_id_val, cat_name, parent_id),
-                buffers,
-                flush,
-            )
-        leaf = path[-1][1] if path else None
-        leaf_id = int(leaf) if isinstance(leaf, str) and leaf.isdigit() else None
-        if leaf_id is not None:
-            pair = (asin, leaf_id)
-            _queue_with_flush("product_category", pair, buffers, flush)
-
-    for sim in product_data.get("similar", []):
-        if not sim:
-            continue
-        if sim == asin:
-            continue
-        if sim in inserted_products:
-            pair = (asin, sim)
-            _queue_with_flush("product_similar", pair, buffers, flush)
-        else:
-            pending_similars.setdefault(sim, set()).add(asin)
-
-    waiting_sources = pending_similars.pop(asin, set())
-    for source in waiting_sources:
-        pair = (source, asin)
-        if source in inserted_products:
-            _queue_with_flush("product_similar", pair, buffers, flush)
-
-    for rev in product_data.get("reviews", []):
-        if not isinstance(rev, dict):
+class LoaderState:
+    # Contexto do caminho quente de _insert_product (um por processo de parsing)
+    __slots__ = ("queues", "seen_categories", "seen_customers")
+
+    def __init__(self, buffers: Dict[str, List[Tuple[object, ...]]], flush: FlushFunction) -> None:
+        self.queues: Dict[str, QueueFunction] = {
+            table: _create_queue_function(table, buffers, flush) for table in buffers
+        }
+        # categorias e clientes se repetem em quase todo produto: cada id vai ao banco uma vez.
+        # Categorias guardam (nome, pai) da última definição enviada: uma redefinição vai de novo
+        # ao staging e, no merge, prevalece a última (como no DO UPDATE linha a linha)
+        self.seen_categories: Dict[int, Tuple[str, Optional[int]]] = {}
+        self.seen_customers: Set[str] = set()
+
+
+def _insert_product(state: LoaderState, product_data: ProductData) -> None:
+    queues = state.queues
+    queue_category = queues["category"]
+    queue_product_category = queues["product_category"]
+    queue_product_similar = queues["product_similar"]
+    queue_customer = queues["customer"]
+    queue_review = queues["review"]
+    seen_categories = state.seen_categories
+    seen_customers = state.seen_customers
+    product_defaults = _ensure_product_defaults(product_data)
+    if not product_defaults:
+        return
+
+    asin, title, group_name, salesrank, total_reviews, downloaded, avg_rating = product_defaults
+
+    queues["product"]((asin, title, group_name, salesrank, total_reviews, downloaded, avg_rating))
+
+    # Contrato do parser: caminhos são tuplas de (nome, id int ou None) e reviews são tuplas ReviewEntry já validadas
+    for path in product_data.get("categories", []):
+        if not path:
             continue
-        cust_id = rev.get("customer")
-        if not cust_id:
+        for idx, (cat_name, cat_id) in enumerate(path):
+            if cat_id is None:
+                continue
+            parent_id = path[idx - 1][1] if idx > 0 else None
+            definition = (cat_name, parent_id)
+            if seen_categories.get(cat_id) != definition:
+                seen_categories[cat_id] = definition
+                queue_category((cat_id, cat_name, parent_id))
+        leaf_id = path[-1][1]
+        if leaf_id is not None:
+            queue_product_category((asin, leaf_id))
+
+    for sim in product_data.get("similar", []):
+        if sim == asin:
             continue
-        _queue_with_flush("customer", (cust_id,), buffers, flush)
-        rating = _normalize_int(rev.get("rating"))
-        votes = _normalize_int(rev.get("votes"))
-        helpful = _normalize_int(rev.get("helpful"))
-        review_date = rev.get("date")
-        if not review_date:
-            continue
-        _queue_with_flush(
-            "review",
-            (review_date, rating, votes, helpful, asin, cust_id),
-            buffers,
-            flush,
-        )
-
-
-def _new_product_data() -> ProductData:
-    return {
-        "asin": None,
-        "title": None,
-        "group": None,
-        "salesrank": None,
-        "total_reviews": None,
-        "downloaded": None,
-        "avg_rating": None,
-        "discontinued": False,
-        "categories": [],
-        "similar": [],
-        "reviews": [],
-    }
+        queue_product_similar((asin, sim))
+
+    # _parse_review_line garante data e cliente não vazios e rating/votes/helpful já como int
+    for review_date, cust_id, rating, votes, helpful in product_data.get("reviews", []):
+        if cust_id not in seen_customers:
+            seen_customers.add(cust_id)
+            queue_customer((cust_id,))
+        queue_review((review_date, rating, votes, helpful, asin, cust_id))
+
+
+def _new_product_data() -> ProductData:
+    return {
+        "asin": None,
+        "title": None,
+        "group": None,
+        "salesrank": None,
+        "total_reviews": None,
+        "downloaded": None,
+        "avg_rating": None,
+        "discontinued": False,
+        "categories": [],
+        "similar": [],
+        "reviews": [],
+    }
+
+
+def _reset_product_data(product_data: ProductData) -> None:
+    # Reaproveita o mesmo dict (e listas) entre produtos em vez de alocar um novo a cada "Id:"
+    product_data["asin"] = None
+    product_data["title"] = None
+    product_data["group"] = None
+    product_data["salesrank"] = None
+    product_data["total_reviews"] = None
+    product_data["downloaded"] = None
+    product_data["avg_rating"] = None
+    product_data["discontinued"] = False
+    product_data["categories"].clear()
+    product_data["similar"].clear()
+    product_data["reviews"].clear()
+
+
+def _handle_asin(product_data: ProductData, rest: str, infile: TextIO) -> None:
+    product_data["asin"] = rest
+
+
+def _handle_title(product_data: ProductData, rest: str, infile: TextIO) -> None:
+    product_data["title"] = rest
+
+
+def _handle_discontinued(product_data: ProductData, rest: str, infile: TextIO) -> None:
+    product_data["title"] = "Discontinued product"
+    product_data["discontinued"] = True
+
+
+def _handle_group(product_data: ProductData, rest: str, infile: TextIO) -> None:
+    # poucos grupos distintos (Book, DVD, Music...): todas as linhas compartilham o mesmo objeto
+    product_data["group"] = sys.intern(rest)
+
+
+def _handle_salesrank(product_data: ProductData, rest: str, infile: TextIO) -> None:
+    product_data["salesrank"] = _normalize_int(rest)
+
+
+def _handle_similar(product_data: ProductData, rest: str, infile: TextIO) -> None:
+    parts = rest.split()
+    if parts:
+        # o SNAP informa a contagem exata de ASINs similares logo após "similar:"
+        product_data["similar"] = parts[1:1 + _normalize_int(parts[0])]
+
+
+def _handle_categories(product_data: ProductData, rest: str, infile: TextIO) -> None:
+    parts = rest.split()
+    num_paths = _normalize_int(parts[0]) if parts else 0
+    for _ in range(num_paths):
+        cat_line = infile.readline()
+        if not cat_line:
+            break
+        path = _parse_category_path(cat_line.strip())
+        if path:
+            product_data["categories"].append(path)
+
+
+def _handle_reviews(product_data: ProductData, rest: str, infile: TextIO) -> None:
+    total, downloaded, avg = _parse_reviews_header(rest)
+    product_data["total_reviews"] = total
+    product_data["downloaded"] = downloaded
+    product_data["avg_rating"] = avg
+    num_to_read = _normalize_int(downloaded)
+    for _ in range(num_to_read):
+        rev_line = infile.readline()
+        if not rev_line:
+            break
+        review_entry = _parse_review_line(rev_line)
+        if review_entry:
+            product_data["reviews"].append(review_entry)
+
+
+# Despacho por chave (texto antes do primeiro ":") em vez de uma cadeia de startswith
+LINE_HANDLERS: Dict[str, LineHandler] = {
+    "ASIN": _handle_asin,
+    "title": _handle_title,
+    "group": _handle_group,
+    "salesrank": _handle_salesrank,
+    "similar": _handle_similar,
+    "categories": _handle_categories,
+    "reviews": _handle_reviews,
+}
+
+
+def _parse_products(infile: TextIO, on_product: ProductCallback) -> None:
+    product_data: Optional[ProductData] = None
+    for raw_line in infile:
+        line = raw_line.strip()
+        if not line:
+            continue  # ignora linhas vazias
+
+        key, _, rest = line.partition(":")
+        if key == "Id":
+            if product_data is None:
+                product_data = _new_product_data()
+            else:
+                on_product(product_data)
+                _reset_product_data(product_data)
+            continue
+
+        if product_data is None:
+            continue
+
+        handler = LINE_HANDLERS.get(key)
+        if handler is not None:
+            handler(product_data, rest.strip(), infile)
+        elif line.lower().startswith("discontinued product"):
+            _handle_discontinued(product_data, rest, infile)
+    if product_data:
+        on_product(product_data)
+
+
+def _split_input(path: str, chunk_size: int) -> List[Tuple[int, int]]:
+    # Fatias de ~chunk_size bytes que sempre começam em uma linha "Id:" (nenhum produto é cortado)
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as raw:
+        pos = chunk_size
+        while pos < size:
+            raw.seek(pos)
+            raw.readline()  # descarta a linha parcial
+            line_start = size
+            for line in iter(raw.readline, b""):
+                if line.startswith(b"Id:"):
+                    line_start = raw.tell() - len(line)
+                    break
+            if line_start >= size:
+                break
+            bounds.append(line_start)
+            pos = line_start + chunk_size
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def _parse_chunk(task: Tuple[str, int, int]) -> Dict[str, List[Tuple[object, ...]]]:
+    # Executa em um processo worker: devolve as linhas de cada tabela prontas para o COPY
+    path, start, end = task
+    with open(path, "rb") as raw:
+        raw.seek(start)
+        text = raw.read(end - start).decode("utf-8")
+
+    rows: Dict[str, List[Tuple[object, ...]]] = {table: [] for table in INSERT_STATEMENTS}
+    buffers: Dict[str, List[Tuple[object, ...]]] = {table: [] for table in INSERT_STATEMENTS}
+
+    def _collect(table: str) -> None:
+        rows[table].extend(buffers[table])
+        buffers[table].clear()
+
+    state = LoaderState(buffers, _collect)
+    _parse_products(io.StringIO(text), functools.partial(_insert_product, state))
+    for table in INSERT_STATEMENTS:
+        _collect(table)
+    return rows
+
+
+def _parse_chunks_bounded(
+    pool, tasks: List[Tuple[str, int, int]], max_pending: int
+) -> Iterator[Dict[str, List[Tuple[object, ...]]]]:
+    # Como pool.imap, na ordem do arquivo, mas com no máximo max_pending fatias em voo
+    pending = collections.deque()
+    task_iter = iter(tasks)
+    for task in task_iter:
+        pending.append(pool.apply_async(_parse_chunk, (task,)))
+        if len(pending) >= max_pending:
+            break
+    while pending:
+        chunk_rows = pending.popleft().get()
+        task = next(task_iter, None)
+        if task is not None:
+            pending.append(pool.apply_async(_parse_chunk, (task,)))
+        yield chunk_rows
+
+
+def _advise_sequential_read(infile: TextIO) -> None:
+    # Pede ao kernel read-ahead agressivo; é só uma dica, então falhas são ignoradas
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        os.posix_fadvise(infile.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    except OSError:
+        pass
+
+
+def _create_staging_tables(cur) -> None:
+    for table in INSERT_STATEMENTS:
+        cur.execute(STAGING_STATEMENTS[table])
+
+
+def _merge_deferred_staging(cur, counts: Dict[str, int]) -> None:
+    for table, statement in DEFERRED_MERGE_STATEMENTS.items():
+        savepoint = f"sp_{table}"
+        cur.execute(f"SAVEPOINT {savepoint}")
+        try:
+            cur.execute(statement)
+            counts[table] = cur.rowcount
+        except Exception as merge_exc:
+            if table not in DEFERRED_ROW_STATEMENTS:
+                raise
+            cur.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+            print(
+                f"[Carga][Aviso] Erro no merge da tabela {table}: {merge_exc}. "
+                "Tentando inserções individuais...",
+                file=sys.stderr,
+            )
+            select_statement, insert_statement = DEFERRED_ROW_STATEMENTS[table]
+            cur.execute(select_statement)
+            rows = cur.fetchall()
+            counts[table] = _insert_rows_individually(cur, table, insert_statement, rows, savepoint)
+        cur.execute(f"RELEASE SAVEPOINT {savepoint}")
+        cur.execute(f"TRUNCATE {STAGING_TABLES[table]}")
+
+
+def _read_sql_file(path: str) -> str:
+    with open(path, "r") as sql_file:
+        return sql_file.read()
 
 
 def _apply_post_load_constraints(cur) -> None:
+    # arquivo inteiro em um único execute (sem parâmetros o psycopg aceita vários comandos)
+    cur.execute(_read_sql_file(POST_LOAD_SCHEMA_PATH))
     for statement in POST_LOAD_STATEMENTS:
         cur.execute(statement)
 
@@ -349,6 +814,8 @@ def main() -> int:
     parser.add_argument("--db-pass", type=str, required=True, help="Senha do banco de dados.")
     # Parâmetro do caminho do arquivo de entrada
     parser.add_argument("--input", type=str, required=True, help="Caminho do arquivo de entrada SNAP dentro do contêiner (ex: /data/snap_amazon.txt).")
+    # Paralelismo do parsing (a carga no banco continua em uma única conexão)
+    parser.add_argument("--workers", type=int, default=1, help="Processos de parsing em paralelo (padrão 1 = sequencial).")
 
     args = parser.parse_args()
     start_time = time.time()
@@ -370,19 +837,20 @@ def main() -> int:
 
     cur = conn.cursor()
     try:
-        cur.execute("SET synchronous_commit TO OFF")
-        cur.execute("SET client_min_messages TO WARNING")
+        with conn.pipeline():
+            for statement in SESSION_SETTINGS:
+                cur.execute(statement)
         conn.commit()
     except Exception as e:
         print(f"[Carga] Aviso ao ajustar sessão: {e}", file=sys.stderr)
 
     # Executa DDL do schema
     try:
-        with open("/app/sql/schema.sql", "r") as schema_file:
-            schema_sql = schema_file.read()
-            statements = [stmt.strip() for stmt in schema_sql.split(";") if stmt.strip()]
-            for stmt in statements:
-                cur.execute(stmt)
+        # schema.sql vai inteiro em um único round-trip (sem quebrar em ';', que pode
+        # aparecer em comentários); o DDL de staging segue em pipeline
+        cur.execute(_read_sql_file(SCHEMA_PATH))
+        with conn.pipeline():
+            _create_staging_tables(cur)
         conn.commit()
         print("[Carga] Esquema do banco de dados criado com sucesso.")
     except Exception as e:
@@ -390,104 +858,25 @@ def main() -> int:
         conn.close()
         return 1
 
-    buffers: Dict[str, List[Tuple[object, ...]]] = {table: [] for table in INSERT_STATEMENTS}
-    counts: Dict[str, int] = {table: 0 for table in INSERT_STATEMENTS}
-    flush_counters: Dict[str, int] = {table: 0 for table in INSERT_STATEMENTS}
-
-    flush = _create_flush_function(conn, cur, buffers, counts, flush_counters)
-
-    # Inicializa estruturas auxiliares para evitar duplicatas
-    inserted_products: Set[str] = set()
-    pending_similars: Dict[str, Set[str]] = {}
-
-    # Processa o arquivo de entrada
-    try:
-        with open(args.input, "r", encoding="utf-8") as infile:
-            product_data: Optional[ProductData] = None
-            for raw_line in infile:
-                line = raw_line.strip()
-                if not line:
-                    continue  # ignora linhas vazias
-
-                if line.startswith("Id:"):
-                    if product_data:
-                        _insert_product(
-                            product_data,
-                            buffers,
-                            flush,
-                            inserted_products,
-                            pending_similars,
-                        )
-                    product_data = _new_product_data()
-                    continue
-
-                if product_data is None:
-                    continue
-
-                if line.startswith("ASIN:"):
-                    product_data["asin"] = line.split(":", 1)[1].strip()
-                elif line.startswith("title:"):
-                    product_data["title"] = line.split(":", 1)[1].strip()
-                elif line.lower().startswith("discontinued product"):
-                    product_data["title"] = "Discontinued product"
-                    product_data["discontinued"] = True
-                elif line.startswith("group:"):
-                    product_data["group"] = line.split(":", 1)[1].strip()
-                elif line.startswith("salesrank:"):
-                    val = line.split(":", 1)[1].strip()
-                    product_data["salesrank"] = _normalize_int(val)
-                elif line.startswith("similar:"):
-                    parts = line.split()
-                    if len(parts) >= 2:
-                        count_sim = _normalize_int(parts[1])
-                        sim_asins = parts[2:2 + count_sim] if count_sim > 0 else parts[2:]
-                        product_data["similar"] = sim_asins
-                elif line.startswith("categories:"):
-                    parts = line.split()
-                    num_paths = _normalize_int(parts[1]) if len(parts) > 1 else 0
-                    for _ in range(num_paths):
-                        cat_line = infile.readline()
-                        if not cat_line:
-                            break
-                        cat_line = cat_line.strip()
-                        if not cat_line:
-                            continue
-                        if cat_line.startswith("|"):
-                            cat_line = cat_line[1:]
-                        segments = [seg for seg in cat_line.split("|") if seg]
-                        path: CategoryPath = []
-                        for seg in segments:
-                            if "[" in seg:
-                                name, cid = seg.rsplit("[", 1)
-                                cid = cid.rstrip("]")
-                            else:
-                                name, cid = seg, ""
-                            path.append((name.strip(), cid))
-                        if path:
-                            product_data["categories"].append(path)
-                elif line.startswith("reviews:"):
-                    m_total = re.search(r"total:\s*(\d+)", line)
-                    m_down = re.search(r"downloaded:\s*(\d+)", line)
-                    m_avg = re.search(r"avg rating:\s*([\d\.]+)", line)
-                    product_data["total_reviews"] = int(m_total.group(1)) if m_total else None
-                    product_data["downloaded"] = int(m_down.group(1)) if m_down else None
-                    product_data["avg_rating"] = float(m_avg.group(1)) if m_avg else None
-                    num_to_read = _normalize_int(product_data.get("downloaded"))
-                    for _ in range(num_to_read):
-                        rev_line = infile.readline()
-                        if not rev_line:
-                            break
-                        review_entry = _parse_review_line(rev_line)
-                        if review_entry:
-                            product_data["reviews"].append(review_entry)
-            if product_data:
-                _insert_product(
-                    product_data,
-                    buffers,
-                    flush,
-                    inserted_products,
-                    pending_similars,
-                )
+    buffers: Dict[str, List[Tuple[object, ...]]] = {table: [] for table in INSERT_STATEMENTS}
+    counts: Dict[str, int] = {table: 0 for table in INSERT_STATEMENTS}
+
+    flush = _create_flush_function(conn, cur, buffers, counts)
+
+    # Processa o arquivo de entrada
+    try:
+        if args.workers > 1:
+            tasks = [(args.input, start, end) for start, end in _split_input(args.input, PARSE_CHUNK_SIZE)]
+            with multiprocessing.Pool(args.workers) as pool:
+                # os workers seguem parseando as próximas fatias enquanto o COPY roda aqui
+                max_pending = args.workers * MAX_PENDING_CHUNKS_PER_WORKER
+                for chunk_rows in _parse_chunks_bounded(pool, tasks, max_pending):
+                    for table in FINAL_FLUSH_ORDER:
+                        _queue_rows(table, chunk_rows[table], buffers, flush)
+        else:
+            with open(args.input, "r", encoding="utf-8", newline="\n", buffering=INPUT_BUFFER_SIZE) as infile:
+                _advise_sequential_read(infile)
+                _parse_products(infile, functools.partial(_insert_product, LoaderState(buffers, flush)))
 
     except Exception as e:
         print(f"[Carga] Erro durante processamento do arquivo: {e}", file=sys.stderr)
@@ -495,8 +884,16 @@ def main() -> int:
         return 1
 
     # Flush final dos buffers
-    for table in FINAL_FLUSH_ORDER:
-        flush(table)
+    for table in FINAL_FLUSH_ORDER:
+        flush(table)
+
+    # A carga inteira (incluindo FKs e índices pós-carga) roda em uma única transação
+    try:
+        _merge_deferred_staging(cur, counts)
+    except Exception as e:
+        print(f"[Carga] Erro ao consolidar as tabelas de merge adiado: {e}", file=sys.stderr)
+        conn.close()
+        return 1
 
     try:
         _apply_post_load_constraints(cur)
@@ -3,8 +3,108 @@ import sys
 import os
 import csv
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
 from db import get_conn
 
+# Consultas do dashboard. As de 1 a 3 filtram pelo ASIN informado; as de 4 a 7 são agregações globais.
+# Todas são independentes entre si e rodam em paralelo, cada tarefa em sua própria conexão.
+SQL_Q1_TOP_REVIEWS = """SELECT review_date, customer_id, rating, votes, helpful
+                        FROM review
+                        WHERE asin = %s AND rating = %s
+                        ORDER BY helpful DESC
+                        LIMIT 5"""
+
+SQL_Q2_SIMILAR_BETTER_SALES = """SELECT p.asin, p.title, p.salesrank
+                                 FROM product_similar ps
+                                 JOIN product p ON ps.similar_asin = p.asin
+                                 JOIN product orig ON ps.asin = orig.asin
+                                 WHERE ps.asin = %s AND p.salesrank < orig.salesrank
+                                 ORDER BY p.salesrank ASC"""
+
+SQL_Q3_DAILY_AVG_RATING = """SELECT review_date, AVG(rating) as avg_rating
+                             FROM review
+                             WHERE asin = %s
+                             GROUP BY review_date
+                             ORDER BY review_date"""
+
+# Top 10 de cada grupo via LATERAL: com o índice (group_name, salesrank) cada grupo lê apenas as
+# 10 primeiras entradas, em vez de ordenar a tabela inteira. Produtos sem grupo (group_name NULL)
+# não casam com "=" e entram pelo ramo IS NULL, que também usa o índice
+SQL_Q4_TOP10_SALES_BY_GROUP = """SELECT g.grp, t.asin, t.title, t.salesrank
+                                 FROM (SELECT DISTINCT group_name AS grp FROM product WHERE group_name IS NOT NULL) g
+                                 CROSS JOIN LATERAL (
+                                     SELECT asin, title, salesrank
+                                     FROM product
+                                     WHERE group_name = g.grp
+                                     ORDER BY salesrank ASC
+                                     LIMIT 10
+                                 ) t
+                                 UNION ALL
+                                 (SELECT NULL, asin, title, salesrank
+                                  FROM product
+                                  WHERE group_name IS NULL
+                                  ORDER BY salesrank ASC
+                                  LIMIT 10)
+                                 ORDER BY 1, 4"""
+
+# Média de "helpful" das reviews positivas por produto, usada pelas consultas 5 e 6. Calculada uma
+# única vez numa tabela temporária (por sessão, por isso Q5 e Q6 rodam na mesma conexão)
+SQL_CREATE_PROD_HELP = """CREATE TEMP TABLE prod_help ON COMMIT DROP AS
+                          SELECT asin, AVG(helpful)::float8 AS avg_help
+                          FROM review
+                          WHERE rating >= 4
+                          GROUP BY asin"""
+
+SQL_Q5_TOP10_AVG_HELPFUL = """SELECT p.asin, p.title, ph.avg_help as avg_helpful
+                              FROM prod_help ph
+                              JOIN product p ON p.asin = ph.asin
+                              ORDER BY avg_helpful DESC
+                              LIMIT 10"""
+
+SQL_Q6_TOP5_CATEGORIES = """SELECT c.category_name, AVG(ph.avg_help) AS category_avg_help
+                            FROM category c
+                            JOIN product_category pc ON c.category_id = pc.category_id
+                            JOIN prod_help ph ON pc.asin = ph.asin
+                            GROUP BY c.category_id, c.category_name
+                            ORDER BY category_avg_help DESC
+                            LIMIT 5"""
+
+SQL_Q7_TOP10_CUSTOMERS_BY_GROUP = """SELECT grp, customer_id, review_count FROM (
+                                         SELECT p.group_name AS grp, r.customer_id, COUNT(*) AS review_count,
+                                                ROW_NUMBER() OVER (PARTITION BY p.group_name ORDER BY COUNT(*) DESC) AS rk
+                                         FROM review r
+                                         JOIN product p ON r.asin = p.asin
+                                         GROUP BY p.group_name, r.customer_id
+                                     ) sub
+                                     WHERE rk <= 10
+                                     ORDER BY grp, review_count DESC"""
+
+Query = Tuple[str, Optional[Tuple[object, ...]]]
+
+
+def _fetch_results(db_args: Tuple[object, ...], queries: Sequence[Query], prepare: Optional[bool] = None,
+                   setup: Sequence[str] = ()) -> List[List[tuple]]:
+    """
+    Executa as consultas em sequência numa conexão própria (conexões não são compartilhadas entre
+    threads) e retorna os resultados na mesma ordem. Com prepare=True a mesma consulta executada
+    com parâmetros diferentes é preparada no servidor uma única vez. Os comandos de `setup` rodam
+    antes, na mesma transação (ex.: tabelas temporárias compartilhadas pelas consultas).
+    """
+    conn = get_conn(*db_args, autocommit=False)
+    try:
+        cur = conn.cursor()
+        for statement in setup:
+            cur.execute(statement)
+        results = []
+        for sql, params in queries:
+            cur.execute(sql, params, prepare=prepare)
+            results.append(cur.fetchall())
+        return results
+    finally:
+        conn.close()
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(description="TP1 3.3 – Executa consultas do dashboard no banco PostgreSQL.")
     parser.add_argument("--db-host", required=True, help="Host do banco (serviço Postgres no docker-compose).")
@@ -14,6 +114,7 @@ def main() -> int:
     parser.add_argument("--db-pass", required=True, help="Senha do banco.")
     parser.add_argument("--product-asin", help="ASIN de um produto específico para consultas filtradas.")
     parser.add_argument("--output", default="/app/out", help="Diretório de saída dos CSVs (padrão: /app/out).")
+    parser.add_argument("--jobs", type=int, default=4, help="Consultas executadas em paralelo, cada uma em sua própria conexão (padrão 4).")
     args = parser.parse_args()
 
     start_time = time.time()
@@ -42,29 +143,29 @@ def main() -> int:
     # Garante que diretório de saída existe
     os.makedirs(args.output, exist_ok=True)
 
+    db_args = (args.db_host, args.db_port, args.db_name, args.db_user, args.db_pass)
+    pool = ThreadPoolExecutor(max_workers=max(1, args.jobs))
     try:
+        # Dispara todas as consultas de uma vez; os resultados são impressos e gravados na ordem original
+        futures: Dict[str, Future] = {}
+        if args.product_asin:
+            asin = args.product_asin
+            # 5 reviews mais úteis com maior rating (5) e 5 com menor rating (1): a mesma consulta,
+            # preparada no servidor e executada para cada rating sem novo parse/plan
+            futures["q1"] = pool.submit(_fetch_results, db_args,
+                                        [(SQL_Q1_TOP_REVIEWS, (asin, 5)), (SQL_Q1_TOP_REVIEWS, (asin, 1))], True)
+            futures["q2"] = pool.submit(_fetch_results, db_args, [(SQL_Q2_SIMILAR_BETTER_SALES, (asin,))])
+            futures["q3"] = pool.submit(_fetch_results, db_args, [(SQL_Q3_DAILY_AVG_RATING, (asin,))])
+        futures["q4"] = pool.submit(_fetch_results, db_args, [(SQL_Q4_TOP10_SALES_BY_GROUP, None)])
+        futures["q5_q6"] = pool.submit(_fetch_results, db_args,
+                                       [(SQL_Q5_TOP10_AVG_HELPFUL, None), (SQL_Q6_TOP5_CATEGORIES, None)],
+                                       setup=[SQL_CREATE_PROD_HELP])
+        futures["q7"] = pool.submit(_fetch_results, db_args, [(SQL_Q7_TOP10_CUSTOMERS_BY_GROUP, None)])
+
         # Consulta 1
         if args.product_asin:
             print(f"\nConsulta 1: 5 comentários mais úteis com maior e menor avaliação para o produto {args.product_asin} – {product_title}")
-            # 5 reviews mais úteis com maior rating (5) e 5 com menor rating (1)
-            cur.execute(
-                """SELECT review_date, customer_id, rating, votes, helpful
-                   FROM review
-                   WHERE asin = %s AND rating = 5
-                   ORDER BY helpful DESC
-                   LIMIT 5""",
-                (args.product_asin,)
-            )
-            top5_high = cur.fetchall()
-            cur.execute(
-                """SELECT review_date, customer_id, rating, votes, helpful
-                   FROM review
-                   WHERE asin = %s AND rating = 1
-                   ORDER BY helpful DESC
-                   LIMIT 5""",
-                (args.product_asin,)
-            )
-            top5_low = cur.fetchall()
+            top5_high, top5_low = futures["q1"].result()
 
             # Imprime resumo no console
             print("  - Top 5 avaliações positivas mais úteis:")
@@ -89,16 +190,7 @@ def main() -> int:
         # Consulta 2
         if args.product_asin:
             print(f"\nConsulta 2: Produtos similares a {args.product_asin} com melhor posição de vendas que ele")
-            cur.execute(
-                """SELECT p.asin, p.title, p.salesrank
-                   FROM product_similar ps
-                   JOIN product p ON ps.similar_asin = p.asin
-                   JOIN product orig ON ps.asin = orig.asin
-                   WHERE ps.asin = %s AND p.salesrank < orig.salesrank
-                   ORDER BY p.salesrank ASC""",
-                (args.product_asin,)
-            )
-            better_sales = cur.fetchall()
+            better_sales = futures["q2"].result()[0]
             for (asin, title, salesrank) in better_sales:
                 print(f"    {asin} – {title} (salesrank {salesrank})")
             # CSV
@@ -112,15 +204,7 @@ def main() -> int:
         # Consulta 3
         if args.product_asin:
             print(f"\nConsulta 3: Evolução diária da média de avaliações para o produto {args.product_asin}")
-            cur.execute(
-                """SELECT review_date, AVG(rating) as avg_rating
-                   FROM review
-                   WHERE asin = %s
-                   GROUP BY review_date
-                   ORDER BY review_date""",
-                (args.product_asin,)
-            )
-            daily_avg = cur.fetchall()
+            daily_avg = futures["q3"].result()[0]
             print("    Data         Média Rating")
             for (date, avg) in daily_avg:
                 avg_val = float(avg)
@@ -136,16 +220,7 @@ def main() -> int:
 
         # Consulta 4
         print("\nConsulta 4: Top 10 produtos líderes de venda em cada grupo")
-        cur.execute(
-            """SELECT grp, asin, title, salesrank FROM (
-                 SELECT group_name as grp, asin, title, salesrank,
-                        ROW_NUMBER() OVER (PARTITION BY group_name ORDER BY salesrank ASC) as rk
-                 FROM product
-               ) sub
-               WHERE rk <= 10
-               ORDER BY grp, rk"""
-        )
-        top10_by_group = cur.fetchall()
+        top10_by_group = futures["q4"].result()[0]
         current_group = None
         rank = 1
         for (grp, asin, title, salesrank) in top10_by_group:
@@ -164,16 +239,7 @@ def main() -> int:
 
         # Consulta 5
         print("\nConsulta 5: Top 10 produtos com maior média de avaliações úteis positivas")
-        cur.execute(
-            """SELECT p.asin, p.title, AVG(r.helpful::float) as avg_helpful
-               FROM product p
-               JOIN review r ON p.asin = r.asin
-               WHERE r.rating >= 4
-               GROUP BY p.asin, p.title
-               ORDER BY avg_helpful DESC
-               LIMIT 10"""
-        )
-        top10_helpful = cur.fetchall()
+        top10_helpful, top5_categories = futures["q5_q6"].result()
         for (asin, title, avg_helpful) in top10_helpful:
             print(f"    {title} (ASIN {asin}) – média útil = {avg_helpful:.2f}")
         # CSV
@@ -185,22 +251,6 @@ def main() -> int:
 
         # Consulta 6
         print("\nConsulta 6: Top 5 categorias com a maior média de avaliações úteis positivas por produto")
-        cur.execute(
-            """WITH prod_help AS (
-                   SELECT asin, AVG(helpful::float) AS avg_help
-                   FROM review
-                   WHERE rating >= 4
-                   GROUP BY asin
-               )
-               SELECT c.category_name, AVG(ph.avg_help) AS category_avg_help
-               FROM category c
-               JOIN product_category pc ON c.category_id = pc.category_id
-               JOIN prod_help ph ON pc.asin = ph.asin
-               GROUP BY c.category_id, c.category_name
-               ORDER BY category_avg_help DESC
-               LIMIT 5"""
-        )
-        top5_categories = cur.fetchall()
         for (cat_name, avg_help) in top5_categories:
             print(f"    {cat_name} – média útil positiva = {avg_help:.2f}")
         # CSV
@@ -212,18 +262,7 @@ def main() -> int:
 
         # Consulta 7
         print("\nConsulta 7: Top 10 clientes que mais fizeram comentários por grupo de produto")
-        cur.execute(
-            """SELECT grp, customer_id, review_count FROM (
-                   SELECT p.group_name AS grp, r.customer_id, COUNT(*) AS review_count,
-                          ROW_NUMBER() OVER (PARTITION BY p.group_name ORDER BY COUNT(*) DESC) AS rk
-                   FROM review r
-                   JOIN product p ON r.asin = p.asin
-                   GROUP BY p.group_name, r.customer_id
-               ) sub
-               WHERE rk <= 10
-               ORDER BY grp, review_count DESC"""
-        )
-        top10_customers = cur.fetchall()
+        top10_customers = futures["q7"].result()[0]
         current_group = None
         for (grp, customer_id, review_count) in top10_customers:
             if grp != current_group:
@@ -238,9 +277,11 @@ def main() -> int:
 
     except Exception as e:
         print(f"[Dashboard] Erro ao executar as consultas: {e}", file=sys.stderr)
+        pool.shutdown(cancel_futures=True)
         conn.close()
         return 1
 
+    pool.shutdown()
     conn.close()
     end_time = time.time()
     elapsed = end_time - start_time